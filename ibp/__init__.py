@@ -1,3 +1,3 @@
 """Initialize the Bottle app."""
 
-from .base import app, models, routes  # noqa: F401
+from .base import app, application, models, routes  # noqa: F401
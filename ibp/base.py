@@ -24,4 +24,4 @@ config = read_server_config()  # pylint: disable=invalid-name
 # pylint: disable=unused-import, wrong-import-position
 from . import models  # noqa: F401, E402
 from . import routes  # noqa: F401, E402
-from .routes import app  # noqa: F401, E402
+from .routes import app, application  # noqa: F401, E402
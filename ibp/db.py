@@ -1,14 +1,17 @@
 """Database engine bindings and session-maker."""
 
 import urllib
+import itertools
+import threading
 
 import sqlalchemy  # type: ignore
-from sqlalchemy.orm import sessionmaker  # type: ignore
+from sqlalchemy.orm import scoped_session, sessionmaker  # type: ignore
 
 import pymates  # type: ignore
 
-from .models import Inmate
-from .base import get_toplevel_path
+from .misc import iter_available_indices
+from .models import Inmate, Unit
+from .base import config, get_toplevel_path
 
 
 def create_engine():
@@ -17,19 +20,164 @@ def create_engine():
     filepath = toplevel.joinpath("data.db").absolute()
     uri_parts = ("sqlite", "/", str(filepath), "", "", "")  # netloc needs to be "/".
     uri = urllib.parse.urlunparse(uri_parts)
-    return sqlalchemy.create_engine(uri)
 
+    # Pool connections across requests instead of reconnecting for each one.
+    # Pooled sqlite connections may be handed to a different worker thread, and
+    # writers from other threads wait up to the busy timeout for their locks.
+    return sqlalchemy.create_engine(
+        uri,
+        poolclass=sqlalchemy.pool.QueuePool,
+        pool_size=config.getint("database", "pool_size"),
+        max_overflow=config.getint("database", "max_overflow"),
+        pool_pre_ping=True,
+        query_cache_size=config.getint("database", "query_cache_size"),
+        connect_args={
+            "check_same_thread": False,
+            "timeout": config.getfloat("database", "busy_timeout"),
+        },
+    )
 
-Session = sessionmaker(bind=create_engine(), future=True)
+
+Session = scoped_session(
+    sessionmaker(
+        bind=create_engine(), future=True, autoflush=False, expire_on_commit=False
+    )
+)
+"""Thread-local session registry; call :py:meth:`Session.remove` when done."""
+
+
+def query_used_indices(session, cls, inmate):
+    """Query the indices used by the items of a given model for an inmate.
+
+    Only the index column is selected, so no model objects are loaded.
+
+    :param cls: Model class with an inmate index key, e.g. :py:class:`Request`.
+    :param inmate: Inmate whose items' indices to query.
+
+    :returns: List of the used indices.
+
+    """
+    query = session.query(cls.index).filter_by(
+        inmate_jurisdiction=inmate.jurisdiction, inmate_id=inmate.id
+    )
+    return [index for (index,) in query]
+
+
+def query_available_indices(session, cls, inmate):
+    """Query the indices available to new items of a given model for an inmate.
+
+    The used indices are counted and maximized in the database first. Only when
+    deleted items have left gaps are the used indices loaded to fill them in.
+
+    :param cls: Model class with an inmate index key, e.g. :py:class:`Request`.
+    :param inmate: Inmate whose items' indices to query.
+
+    :returns: Iterator over the available indices in increasing order.
+
+    """
+    count, maximum = session.execute(
+        sqlalchemy.select(
+            sqlalchemy.func.count(cls.index), sqlalchemy.func.max(cls.index)
+        ).filter_by(inmate_jurisdiction=inmate.jurisdiction, inmate_id=inmate.id)
+    ).one()
+
+    if maximum is None or maximum + 1 == count:
+        return itertools.count(count)
+
+    return iter_available_indices(query_used_indices(session, cls, inmate))
+
+
+index_allocation_lock = threading.Lock()
+"""Lock serializing the index allocation and insertion of new inmate items."""
+
+
+def insert_with_indices(session, cls, inmate, items):
+    """Insert new items of a given model for an inmate at the available indices.
+
+    The indices are allocated and the items are inserted and committed while
+    holding :py:data:`index_allocation_lock`, so concurrent inserts for the same
+    inmate cannot be given the same index.
+
+    :param cls: Model class with an inmate index key, e.g. :py:class:`Request`.
+    :param inmate: Inmate to insert the items for.
+    :param items: Column values of each item apart from its inmate index key.
+
+    :returns: List of the inserted rows as dictionaries.
+
+    """
+    with index_allocation_lock:
+        indices = query_available_indices(session, cls, inmate)
+        rows = [
+            dict(
+                inmate_jurisdiction=inmate.jurisdiction,
+                inmate_id=inmate.id,
+                index=index,
+                **item,
+            )
+            for item, index in zip(items, indices)
+        ]
+
+        # An empty executemany would insert a single row of NULLs instead.
+        if rows:
+            session.execute(sqlalchemy.insert(cls), rows)
+            session.commit()
+
+    return rows
+
+
+def inmates_from_responses(session, responses):
+    """Construct inmates from provider responses.
+
+    The units of all of the responses are loaded with one query instead of one
+    query per response.
+
+    :returns: List of the constructed :py:class:`Inmate` objects.
+
+    """
+    responses = list(responses)
+    names = {response["unit"] for response in responses}
+
+    units = {}
+    if names:
+        for unit in session.query(Unit).filter(Unit.name.in_(names)):
+            units.setdefault(unit.name, unit)
+
+    return [Inmate.from_response(session, response, units) for response in responses]
+
+
+def merge_inmates(session, inmates):
+    """Merge inmates constructed from provider responses into a session.
+
+    The existing database entries of the inmates are loaded with one query
+    beforehand, so that each merge finds its entry in the identity map instead
+    of selecting it separately. Inmates without an entry are simply added.
+
+    """
+    ids = {inmate.id for inmate in inmates}
+    existing = session.query(Inmate).filter(Inmate.id.in_(ids)).all() if ids else []
+    keys = {(inmate.jurisdiction, inmate.id) for inmate in existing}
+
+    with session.begin_nested():
+        for inmate in inmates:
+            assert inmate not in session
+            if (inmate.jurisdiction, inmate.id) in keys:
+                session.merge(inmate)
+            else:
+                session.add(inmate)
+
+    del existing  # The identity map only holds weak references until here.
 
 
 # pylint: disable=redefined-builtin, invalid-name
-def query_providers_by_id(session, id: int):
+def query_providers_by_id(session, id: int, jurisdiction: str = None):
     """Query inmate providers with an inmate ID.
 
     :param id: Inmate TDCJ or FBOP ID to search.
     :type id: int
 
+    :param jurisdiction: Optional jurisdiction to restrict the returned inmates to.
+    :type jurisdiction: str
+
     :returns: tuple of (:py:data:`inmates`, :py:data:`errors`) where
 
         - :py:data:`inmates` is a QueryResult for the inmate search.
@@ -37,14 +185,13 @@ def query_providers_by_id(session, id: int):
 
     """
     inmates, errors = pymates.query_by_inmate_id(id)
-    inmates = (Inmate.from_response(session, inmate) for inmate in inmates)
-
-    with session.begin_nested():
-        for inmate in inmates:
-            assert inmate not in session
-            session.merge(inmate)
+    inmates = inmates_from_responses(session, inmates)
+    merge_inmates(session, inmates)
 
     inmates = session.query(Inmate).filter_by(id=id)
+    if jurisdiction is not None:
+        inmates = inmates.filter_by(jurisdiction=jurisdiction)
+
     return inmates, errors
 
 
@@ -64,12 +211,8 @@ def query_providers_by_name(session, first_name: str, last_name: str):
 
     """
     inmates, errors = pymates.query_by_name(first_name, last_name)
-    inmates = (Inmate.from_response(session, inmate) for inmate in inmates)
-
-    with session.begin_nested():
-        for inmate in inmates:
-            assert inmate not in session
-            session.merge(inmate)
+    inmates = inmates_from_responses(session, inmates)
+    merge_inmates(session, inmates)
 
     tolower = sqlalchemy.func.lower
     inmates = session.query(Inmate)
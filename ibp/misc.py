@@ -1,6 +1,8 @@
 """Miscellaneous utility functions."""
 
 import typing
+import hashlib
+import functools
 import itertools
 
 import barcode  # type: ignore
@@ -10,15 +12,15 @@ from PIL import Image, ImageDraw, ImageFont  # type: ignore
 # pylint: disable=invalid-name
 
 
+def iter_available_indices(indices: typing.Iterable[int]) -> typing.Iterator[int]:
+    """Iterate in order over the indices not in an iterable of used indices."""
+    used_indices = set(indices)
+    return (index for index in itertools.count() if index not in used_indices)
+
+
 def get_next_available_index(indices: typing.Iterable[int]) -> int:
     """Get next available index from an iterable of indices."""
-    used_indices = sorted(indices)
-    enumerated = itertools.zip_longest(itertools.count(), used_indices)
-    return next(
-        index
-        for index, used_index in enumerated
-        if used_index is None or index != used_index
-    )
+    return next(iter_available_indices(indices))
 
 
 def code39(text, size, dpi=300):
@@ -142,45 +144,65 @@ def add_text(draw, box, text):
     draw.text((x0, y0), text, font=font)
 
 
-def render_request_label(request, size=(1300, 500)):
-    """Render label for a request."""
-    width, height = size
-
-    image = Image.new("L", size, color=(255,))
-    draw = ImageDraw.Draw(image)
+def get_request_label_texts(request):
+    """Get the texts rendered onto the label for a request."""
+    inmate = request.inmate
+    unit = inmate.unit
 
     id_ = f"{request.inmate_jurisdiction}-{request.inmate_id}-{request.index}"
 
-    # package ID barcode
-    box = Box(0.01 * width, 0.01 * height, 0.99 * width, 0.50 * height)
-    image.paste(code39(id_, box.size), (box.x0, box.y0))
+    if inmate.first_name is None or inmate.last_name is None:
+        inmate_name = "Name: N/A"
+    else:
+        inmate_name = " ".join([inmate.first_name, inmate.last_name])
+
+    unit_name = unit.name if unit is not None else "Unit: N/A"
+    shipping_method = unit.shipping_method if unit is not None else "Shipping: N/A"
+
+    return id_, inmate_name, inmate.jurisdiction, unit_name, shipping_method
 
-    box = Box(0.01 * width, 0.50 * height, 0.99 * width, 0.60 * height)
-    add_text(draw, box, id_)
 
-    # inmate name
-    def get_inmate_name(inmate):
-        if inmate.first_name is None or inmate.last_name is None:
-            return "Name: N/A"
-        return " ".join([inmate.first_name, inmate.last_name])
+def get_request_label_key(request):
+    """Get a key that identifies the rendered label for a request."""
+    texts = "\n".join(str(text) for text in get_request_label_texts(request))
+    return hashlib.blake2b(texts.encode(), digest_size=16).hexdigest()
 
-    box = Box(0.01 * width, 0.60 * height, 0.99 * width, 0.90 * height)
-    add_text(draw, box, get_inmate_name(request.inmate))
 
-    # other info at bottom
-    box = Box(0.01 * width, 0.90 * height, 0.33 * width, 0.98 * height)
-    add_text(draw, box, request.inmate.jurisdiction)
+@functools.lru_cache(maxsize=None)
+def get_label_template(size):
+    """Get the blank canvas and text boxes of a label of a given size."""
+    width, height = size
+
+    image = Image.new("L", size, color=(255,))
+
+    boxes = (
+        # package ID barcode and text
+        Box(0.01 * width, 0.01 * height, 0.99 * width, 0.50 * height),
+        Box(0.01 * width, 0.50 * height, 0.99 * width, 0.60 * height),
+        # inmate name
+        Box(0.01 * width, 0.60 * height, 0.99 * width, 0.90 * height),
+        # other info at bottom
+        Box(0.01 * width, 0.90 * height, 0.33 * width, 0.98 * height),
+        Box(0.33 * width, 0.90 * height, 0.67 * width, 0.99 * height),
+        Box(0.67 * width, 0.90 * height, 0.99 * width, 0.99 * height),
+    )
+
+    return image, boxes
 
-    def get_unit_name(unit):
-        return unit.name if unit is not None else "Unit: N/A"
 
-    box = Box(0.33 * width, 0.90 * height, 0.67 * width, 0.99 * height)
-    add_text(draw, box, get_unit_name(request.inmate.unit))
+def render_request_label(request, size=(1300, 500)):
+    """Render label for a request."""
+    template, boxes = get_label_template(size)
+    barcode_box, *text_boxes = boxes
+
+    image = template.copy()
+    draw = ImageDraw.Draw(image)
+
+    id_, *texts = get_request_label_texts(request)
 
-    def get_shipping_method(unit):
-        return unit.shipping_method if unit is not None else "Shipping: N/A"
+    image.paste(code39(id_, barcode_box.size), (barcode_box.x0, barcode_box.y0))
 
-    box = Box(0.67 * width, 0.90 * height, 0.99 * width, 0.99 * height)
-    add_text(draw, box, get_shipping_method(request.inmate.unit))
+    for box, text in zip(text_boxes, [id_, *texts]):
+        add_text(draw, box, text)
 
     return image
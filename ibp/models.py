@@ -43,6 +43,9 @@ from sqlalchemy.ext.declarative import declared_attr, declarative_base  # type:
 
 from .base import config
 
+INMATES_CACHE_TTL = timedelta(hours=config.getint("warnings", "inmates_cache_ttl"))
+"""Age after which an inmate's database entry is considered stale."""
+
 Base: typing.Any = declarative_base()
 """Base class for :py:mod:`sqlalchemy` models."""
 
@@ -196,7 +199,7 @@ class Inmate(Base):
     """List of requests made by this inmate."""
 
     @classmethod
-    def from_response(cls, session, response):
+    def from_response(cls, session, response, units=None):
         """Construct a :py:class:`Inmate` object from `pymates` response.
 
         This is a convenience classmethod for constructing Inmate objects from
@@ -204,13 +207,20 @@ class Inmate(Base):
 
         :param session: Current sqlalchemy session.
         :param response: Response from inmate data provider.
+        :param units: Optional mapping of unit names to already loaded units.
+            When given, the unit is looked up there instead of being queried.
 
         :returns: Constructed :py:class:`Inmate` object.
 
         """
         kwargs = dict(response)
         kwargs["id"] = int(kwargs["id"].replace("-", ""))
-        kwargs["unit"] = session.query(Unit).filter_by(name=kwargs["unit"]).first()
+
+        if units is None:
+            kwargs["unit"] = session.query(Unit).filter_by(name=kwargs["unit"]).first()
+        else:
+            kwargs["unit"] = units.get(kwargs["unit"])
+
         return Inmate(**kwargs)
 
     def db_entry_is_stale(self):
@@ -220,8 +230,7 @@ class Inmate(Base):
         except TypeError:
             return True
 
-        ttl = timedelta(hours=config.getint("warnings", "inmates_cache_ttl"))
-        return age > ttl
+        return age > INMATES_CACHE_TTL
 
 
 class HasInmateIndexKey:
@@ -37,14 +37,21 @@ as inputs.
 
 # pylint: disable=no-member
 
-import io
-import json
+import os
+import re
+import hashlib
+import time
+import logging
+import tempfile
 import functools
+import threading
 from datetime import date, datetime
 
 import bottle  # type: ignore
+import orjson
 import nameparser  # type: ignore
 import sqlalchemy  # type: ignore
+from sqlalchemy.orm import joinedload, load_only, selectinload  # type: ignore
 import marshmallow  # type: ignore
 
 from . import db
@@ -52,83 +59,196 @@ from . import misc
 from . import models
 from . import schemas
 
-from .base import config
+from .base import config, get_toplevel_path
 
 # setup bottle application
 app = bottle.Bottle()  # pylint: disable=invalid-name
 
+logger = logging.getLogger(__name__)  # pylint: disable=invalid-name
+
+# Bind the (de)serializers of the schema singletons once at import so that the
+# route handlers below reuse the same schema objects on every request.
+_request_load = schemas.request.load
+_request_dump = schemas.request.dump
+_comment_load = schemas.comment.load
+_comment_dump = schemas.comment.dump
+_shipment_load = schemas.shipment.load
+_shipment_dump = schemas.shipment.dump
+_inmate_dump = schemas.inmate.dump
+_inmates_dump = schemas.dump_inmates
+_units_dump = schemas.units.dump
+
+
+def jurisdiction_filter(_conf):
+    """Match only known inmate jurisdictions in route URLs.
+
+    URLs with an unknown jurisdiction are rejected with a 404 by the router
+    itself instead of by a database lookup.
+
+    """
+    regexp = "|".join(re.escape(name) for name in models.Jurisdiction.enums)
+    return regexp, None, None
+
+
+app.router.add_filter("jurisdiction", jurisdiction_filter)
+
 
 ###########
 # Plugins #
 ###########
 
 
-def get_cors_headers() -> dict[str, str]:
-    """Get the CORS headers used within this app."""
-    return {
-        "Access-Control-Allow-Origin": "*",
-        "Access-Control-Allow-Methods": ", ".join(
-            ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
-        ),
-        "Access-Control-Allow-Headers": ", ".join(
-            [
-                "Origin",
-                "Accept",
-                "Content-Type",
-                "X-Requested-With",
-                "X-CSRF-Token",
-            ]
-        ),
-    }
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Methods": ", ".join(
+        ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+    ),
+    "Access-Control-Allow-Headers": ", ".join(
+        [
+            "Origin",
+            "Accept",
+            "Content-Type",
+            "X-Requested-With",
+            "X-CSRF-Token",
+        ]
+    ),
+}
+"""CORS headers used within this app."""
+
+
+class RoutePlugin:
+    """Set CORS headers and manage SQLAlchemy sessions for all routes.
+
+    Both jobs are done within a single wrapper so that each request only pays
+    for one extra Python frame. Routes receive a session as their first
+    argument unless they are declared with ``session=False``, in which case
+    no session is created for them.
 
+    """
 
-def enable_cors(callback):
-    """Enable CORS for all routes."""
+    name = "route"
+    api = 2
 
-    @functools.wraps(callback)
-    def wrapper(*args, **kwargs):
-        bottle.response.headers.update(get_cors_headers())
-        return callback(*args, **kwargs)
+    def apply(self, callback, route):  # pylint: disable=no-self-use
+        """Wrap a route callback."""
+        if not route.config.get("session", True):
 
-    return wrapper
+            @functools.wraps(callback)
+            def wrapper(*args, **kwargs):
+                bottle.response.headers.update(CORS_HEADERS)
+                return callback(*args, **kwargs)
 
+            return wrapper
 
-app.install(enable_cors)
+        @functools.wraps(callback)
+        def wrapper_with_session(*args, **kwargs):
+            bottle.response.headers.update(CORS_HEADERS)
+            session = db.Session()
 
+            try:
+                body = callback(session, *args, **kwargs)
+            except sqlalchemy.exc.SQLAlchemyError as exc:
+                session.rollback()
+                raise bottle.HTTPError(500, "A database error occurred.", exc)
+            finally:
+                db.Session.remove()
 
-def create_sqlalchemy_session(callback):
-    """Create and close SQLAlchemy sessions for all routes."""
+            return body
 
-    @functools.wraps(callback)
-    def wrapper(*args, **kwargs):
-        session = db.Session()
+        return wrapper_with_session
 
-        try:
-            body = callback(session, *args, **kwargs)
-        except sqlalchemy.exc.SQLAlchemyError as exc:
-            session.rollback()
-            raise bottle.HTTPError(500, "A database error occurred.", exc)
-        finally:
-            session.close()
 
-        return body
+class JSONPlugin:
+    """Encode dictionary and list route return values as JSON with :py:mod:`orjson`.
 
-    return wrapper
+    This replaces :py:class:`bottle.JSONPlugin` by sharing its name. As with
+    that plugin, HTTP responses with dictionary bodies are encoded too.
 
+    """
 
-app.install(create_sqlalchemy_session)
-app.install(bottle.JSONPlugin())
+    name = "json"
+    api = 2
 
+    def apply(self, callback, route):  # pylint: disable=no-self-use
+        """Wrap a route callback."""
+        if not route.config.get("json", True):
+            return callback
 
-def send_bytes(bytes_, mimetype):
-    """Bottle method for sending bytes objects."""
-    headers = {
-        "Content-Type": mimetype,
-        "Content-Length": len(bytes_),
-    }
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            try:
+                body = callback(*args, **kwargs)
+            except bottle.HTTPResponse as resp:
+                body = resp
+
+            if isinstance(body, (dict, list)):
+                bottle.response.content_type = "application/json"
+                return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS)
+
+            if isinstance(body, bottle.HTTPResponse) and isinstance(body.body, dict):
+                body.body = orjson.dumps(
+                    body.body, option=orjson.OPT_NON_STR_KEYS
+                ).decode()
+                body.content_type = "application/json"
+
+            return body
+
+        return wrapper
+
+
+class QueryCounterPlugin:
+    """Log routes that execute more SQL statements than a given threshold.
+
+    This is a development aid for catching N+1 query regressions. Statements
+    are counted per thread for every engine, so it should only be installed
+    when enabled in the ``[debug]`` section of the server config.
+
+    """
+
+    name = "query_counter"
+    api = 2
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.local = threading.local()
+        sqlalchemy.event.listen(
+            sqlalchemy.engine.Engine, "before_cursor_execute", self.record
+        )
+
+    def record(self, conn, cursor, statement, *args):  # pylint: disable=unused-argument
+        """Record a statement executed within a route."""
+        statements = getattr(self.local, "statements", None)
+        if statements is not None:
+            statements.append(statement)
+
+    def apply(self, callback, route):
+        """Wrap a route callback."""
+
+        @functools.wraps(callback)
+        def wrapper(*args, **kwargs):
+            self.local.statements = statements = []
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                self.local.statements = None
+                if len(statements) > self.threshold:
+                    logger.warning(
+                        "%s %s executed %d SQL statements; first: %s; last: %s",
+                        route.method,
+                        route.rule,
+                        len(statements),
+                        statements[0],
+                        statements[-1],
+                    )
+
+        return wrapper
 
-    body = "" if bottle.request.method == "HEAD" else bytes_
-    return bottle.HTTPResponse(body, **headers)
+
+if config.getboolean("debug", "count_queries", fallback=False):
+    app.install(QueryCounterPlugin(config.getint("debug", "query_threshold")))
+
+app.install(RoutePlugin())
+app.install(JSONPlugin())
 
 
 ##################
@@ -140,7 +260,7 @@ def default_error_handler(error):
     """Handle Bottle errors by setting status code and returning body."""
     bottle.response.content_type = "application/json"
     bottle.response.status = error.status
-    bottle.response.headers.update(get_cors_headers())
+    bottle.response.headers.update(CORS_HEADERS)
 
     messages = (
         [str(message) for message in error.body]
@@ -148,7 +268,7 @@ def default_error_handler(error):
         else [str(error.body)]
     )
 
-    return json.dumps({"messages": messages})
+    return orjson.dumps({"messages": messages})
 
 
 app.default_error_handler = default_error_handler
@@ -159,35 +279,50 @@ app.default_error_handler = default_error_handler
 ###########
 
 
-def load_inmate_from_url_params(route):
-    """Decorate a route to load an inmate from URL parameters."""
+def load_inmate_from_url_params(*options):
+    """Decorate a route to load an inmate from URL parameters.
 
-    @functools.wraps(route)
-    def wrapper(session, jurisdiction, inmate_id):
-        query = session.query(models.Inmate).filter_by(
-            jurisdiction=jurisdiction, id=inmate_id
+    The given :py:mod:`sqlalchemy` loader options are applied to the inmate query
+    so that routes can eagerly load the relationships that they use. The query
+    statement is built once per route and only bound to parameters per call.
+
+    """
+
+    def decorator(route):
+        statement = (
+            sqlalchemy.select(models.Inmate)
+            .options(*options)
+            .filter_by(
+                jurisdiction=sqlalchemy.bindparam("jurisdiction"),
+                id=sqlalchemy.bindparam("inmate_id"),
+            )
         )
 
-        try:
-            inmate = query.one()
-        except sqlalchemy.orm.exc.NoResultFound:
-            inmates, _ = db.query_providers_by_id(session, inmate_id)
-            try:
-                inmate = inmates.filter_by(jurisdiction=jurisdiction).one()
-            except sqlalchemy.orm.exc.NoResultFound as exc:
-                raise bottle.HTTPError(404, "Page not found", exc)
+        @functools.wraps(route)
+        def wrapper(session, jurisdiction, inmate_id):
+            params = {"jurisdiction": jurisdiction, "inmate_id": inmate_id}
+            inmate = session.execute(statement, params).scalar_one_or_none()
 
-        return route(session, inmate)
+            if inmate is None:
+                inmates, _ = db.query_providers_by_id(session, inmate_id, jurisdiction)
+                inmate = inmates.options(*options).one_or_none()
 
-    return wrapper
+            if inmate is None:
+                raise bottle.HTTPError(404, "Page not found")
+
+            return route(session, inmate)
+
+        return wrapper
+
+    return decorator
 
 
 def one_or_404(query):
     """Return a single result from a query or raise a 404 HTTP error."""
-    try:
-        return query.one()
-    except sqlalchemy.orm.exc.NoResultFound as exc:
-        raise bottle.HTTPError(404, "Unit not found", exc)
+    result = query.one_or_none()
+    if result is None:
+        raise bottle.HTTPError(404, "Unit not found")
+    return result
 
 
 def load_unit_from_url_params(route):
@@ -195,25 +330,34 @@ def load_unit_from_url_params(route):
 
     @functools.wraps(route)
     def wrapper(session, id):  # pylint: disable=redefined-builtin, invalid-name
-        query = session.query(models.Unit).filter_by(id=id)
-        unit = one_or_404(query)
+        unit = session.get(models.Unit, id)
+        if unit is None:
+            raise bottle.HTTPError(404, "Unit not found")
         return route(session, unit)
 
     return wrapper
 
 
-def load_cls_from_inmate_index(cls):
-    """Decorate a route to load a given model from inmate index URL parameters."""
+def load_cls_from_inmate_index(cls, *options):
+    """Decorate a route to load a given model from inmate index URL parameters.
+
+    The model is loaded by its primary key with :py:meth:`Session.get`, which
+    checks the identity map first. The given :py:mod:`sqlalchemy` loader
+    options are applied when it has to be queried.
+
+    """
 
     def decorator(route):
         @functools.wraps(route)
         def wrapper(session, jurisdiction, inmate_id, index):
-            query = session.query(cls).filter_by(
-                inmate_jurisdiction=jurisdiction,
-                inmate_id=inmate_id,
-                index=index,
-            )
-            result = one_or_404(query)
+            key = {
+                "inmate_jurisdiction": jurisdiction,
+                "inmate_id": inmate_id,
+                "index": index,
+            }
+            result = session.get(cls, key, options=options)
+            if result is None:
+                raise bottle.HTTPError(404, "Unit not found")
             return route(session, result)
 
         return wrapper
@@ -221,13 +365,17 @@ def load_cls_from_inmate_index(cls):
     return decorator
 
 
-def load_cls_from_autoid(cls):
-    """Decorate a route to load a given model from autoid URL parameters."""
+def load_cls_from_autoid(cls, *options):
+    """Decorate a route to load a given model from autoid URL parameters.
+
+    The given :py:mod:`sqlalchemy` loader options are applied to the query.
+
+    """
 
     def decorator(route):
         @functools.wraps(route)
         def wrapper(session, autoid):
-            query = session.query(cls).filter_by(autoid=autoid)
+            query = session.query(cls).options(*options).filter_by(autoid=autoid)
             result = one_or_404(query)
             return route(session, result)
 
@@ -236,11 +384,104 @@ def load_cls_from_autoid(cls):
     return decorator
 
 
+REQUEST_INMATE_UNIT = joinedload(models.Request.inmate).joinedload(models.Inmate.unit)
+"""Loader option to eagerly load the inmate and unit of a request."""
+
+INMATES_SUMMARY = (
+    load_only(
+        models.Inmate.jurisdiction,
+        models.Inmate.id,
+        models.Inmate.first_name,
+        models.Inmate.last_name,
+        models.Inmate.unit_id,
+    ),
+    joinedload(models.Inmate.unit).load_only(models.Unit.name),
+)
+"""Loader options to load only the inmate columns of search results."""
+
+
+PROVIDERS_RETRY_INTERVAL = config.getfloat("providers", "retry_interval")
+"""Seconds to wait before querying the providers again for the same inmate."""
+
+PROVIDERS_TIMEOUT = config.getfloat("providers", "timeout")
+"""Seconds to wait for another thread's refresh of the same inmate."""
+
+provider_refreshes = {}
+"""Monotonic times and errors of the latest provider refreshes keyed by inmate ID."""
+
+provider_refreshes_in_flight = {}
+"""Events set when the ongoing provider refreshes finish keyed by inmate ID."""
+
+provider_refreshes_lock = threading.Lock()
+"""Lock guarding :py:data:`provider_refreshes` and the refreshes in flight."""
+
+
+def refresh_inmate_if_stale(session, inmate):
+    """Refresh an inmate from the providers if its database entry is stale.
+
+    The provider results are merged into the session, which updates the given
+    inmate in place; there is no need to query it again afterwards. The
+    refresh is committed so that other sessions see it too.
+
+    Concurrent refreshes of the same inmate are coalesced: only one thread
+    queries the providers while the others wait for it, reload the inmate from
+    the database and report the same errors.
+
+    An inmate that stays stale after a refresh, e.g. because the providers no
+    longer list them, is not refreshed again until the retry interval passes.
+    This keeps repeated address and shipping calls for one inmate from
+    querying the providers each time. Meanwhile, the errors of the latest
+    refresh are reported again.
+
+    :returns: List of error strings encountered during the refresh.
+
+    """
+    if not inmate.db_entry_is_stale():
+        return []
+
+    now = time.monotonic()
+
+    with provider_refreshes_lock:
+        in_flight = provider_refreshes_in_flight.get(inmate.id)
+
+        if in_flight is None:
+            refreshed = provider_refreshes.get(inmate.id)
+            if refreshed is not None and now - refreshed[0] < PROVIDERS_RETRY_INTERVAL:
+                return list(refreshed[1])
+
+            done = provider_refreshes_in_flight[inmate.id] = threading.Event()
+
+    if in_flight is not None:
+        if not in_flight.wait(PROVIDERS_TIMEOUT):
+            return ["Timed out waiting for the inmate providers."]
+
+        session.refresh(inmate)
+        with provider_refreshes_lock:
+            _, errors = provider_refreshes.get(inmate.id, (now, []))
+        return list(errors)
+
+    # Reported while throttled if the refresh fails before the providers answer.
+    errors = ["Inmate providers could not be queried."]
+
+    try:
+        _, errors = db.query_providers_by_id(session, inmate.id)
+        session.commit()
+    finally:
+        with provider_refreshes_lock:
+            del provider_refreshes_in_flight[inmate.id]
+            for id_, (refreshed, _) in list(provider_refreshes.items()):
+                if now - refreshed >= PROVIDERS_RETRY_INTERVAL:
+                    del provider_refreshes[id_]
+            provider_refreshes[inmate.id] = now, errors
+        done.set()
+
+    return errors
+
+
 def get_request_address(session, request):
     """Get the address to fill a request."""
     inmate = request.inmate
-    if inmate.db_entry_is_stale():
-        db.query_providers_by_id(session, inmate.id)
+    refresh_inmate_if_stale(session, inmate)
 
     unit = inmate.unit
     if unit is None:
@@ -262,43 +503,307 @@ def get_request_address(session, request):
     }
 
 
-def parse_request_json(schema):
-    """Parse the bottle request JSON using a schema."""
+LABEL_CACHE_DIR = get_toplevel_path().joinpath(config["labels"]["cache"])
+"""Directory where rendered request labels are cached as PNG files.
+
+Labels are only removed when their request is re-rendered or deleted, so old
+labels need to be pruned by an external job, e.g. by modification time.
+
+"""
+
+LABEL_COMPRESS_LEVEL = config.getint("labels", "compress_level")
+"""zlib compression level of the cached PNG label files."""
+
+
+def get_label_cache_dir(request):
+    """Get the label cache directory of the inmate of a request.
+
+    Labels are cached per inmate, so the cached labels of a request can be
+    found again after its label texts change without listing every label.
+
+    """
+    return LABEL_CACHE_DIR.joinpath(request.inmate_jurisdiction, str(request.inmate_id))
+
+
+def get_label_cache_filename(request):
+    """Get the label cache filename of the current label of a request."""
+    return f"{request.index}-{misc.get_request_label_key(request)}.png"
+
+
+def write_label_cache_file(filepath, label):
+    """Atomically write a rendered label image to a label cache file."""
+    filepath.parent.mkdir(parents=True, exist_ok=True)
+
+    file = tempfile.NamedTemporaryFile(dir=filepath.parent, delete=False)
+    try:
+        with file:
+            label.save(file, "PNG", compress_level=LABEL_COMPRESS_LEVEL)
+        os.replace(file.name, filepath)
+    except Exception:
+        os.unlink(file.name)
+        raise
+
+
+def remove_label_cache_files(request, keep=None):
+    """Remove the cached label images of a request apart from a kept filename."""
+    for filepath in get_label_cache_dir(request).glob(f"{request.index}-*.png"):
+        if filepath.name != keep:
+            filepath.unlink(missing_ok=True)
+
+
+def read_request_json():
+    """Read the bottle request JSON body using :py:mod:`orjson`."""
+    request = bottle.request
+    content_type = request.content_type.lower().split(";")[0]
+    if content_type not in ("application/json", "application/json-rpc"):
+        return None
+
+    max_size = request.MEMFILE_MAX
+    body = request.body.read(max_size + 1)
+    if len(body) > max_size:
+        raise bottle.HTTPError(413, "Request entity too large")
+
+    if not body:
+        return None
+
     try:
-        return schema.load(bottle.request.json)
+        return orjson.loads(body)
+    except orjson.JSONDecodeError as exc:
+        raise bottle.HTTPError(400, "Invalid JSON", exc)
+
+
+RESPONSE_CACHE_TTL = config.getfloat("responses", "static_ttl")
+"""Seconds that unit and configuration responses are served from memory."""
+
+response_cache = {}
+"""In-memory cache of encoded JSON responses as (expiry, body, ETag) by route."""
+
+
+def get_etag(body):
+    """Get an ETag for an encoded response body."""
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+
+def send_json_with_etag(body, etag):
+    """Send encoded JSON with an ETag or a 304 if the client's copy matches."""
+    bottle.response.set_header("ETag", etag)
+
+    if_none_match = bottle.request.get_header("If-None-Match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        bottle.response.status = 304
+        return b""
+
+    bottle.response.content_type = "application/json"
+    return body
+
+
+def cache_response(route):
+    """Decorate a route to cache its JSON response in memory.
+
+    Responses are cached per route and parsed URL parameters for
+    :py:data:`RESPONSE_CACHE_TTL` seconds and are served with an ETag so that
+    clients can revalidate them with a 304. Nothing in the app changes units,
+    so the TTL is what picks up unit edits made outside of it, e.g. with the
+    migration tools or directly in the database.
+
+    """
+
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        key = route.__name__, tuple(sorted(kwargs.items()))
+        now = time.monotonic()
+
+        cached = response_cache.get(key)
+        if cached is not None and cached[0] > now:
+            _, body, etag = cached
+        else:
+            body = orjson.dumps(route(*args, **kwargs))
+            etag = get_etag(body)
+            response_cache[key] = now + RESPONSE_CACHE_TTL, body, etag
+
+        return send_json_with_etag(body, etag)
+
+    return wrapper
+
+
+INMATE_RESPONSE_TTL = config.getfloat("responses", "inmate_ttl")
+"""Seconds that an inmate response is served from memory."""
+
+inmate_response_cache = {}
+"""Recent inmate responses as (expiry, body, ETag) keyed by inmate key."""
+
+inmate_response_generation = 0
+"""Counter bumped whenever cached inmate responses are invalidated."""
+
+inmate_response_lock = threading.Lock()
+"""Lock guarding :py:data:`inmate_response_cache` and its generation."""
+
+
+def cache_inmate_response(route):
+    """Decorate an inmate route to briefly cache its JSON response in memory.
+
+    Responses are cached per inmate jurisdiction and ID for
+    :py:data:`INMATE_RESPONSE_TTL` seconds and are served with an ETag like
+    :py:func:`conditional_get`. A request with ``Cache-Control: no-cache``
+    bypasses the cache. Responses with provider errors are not cached so that
+    the next lookup tries again.
+
+    """
+
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        key = kwargs["jurisdiction"], kwargs["inmate_id"]
+        now = time.monotonic()
+
+        if "no-cache" not in bottle.request.get_header("Cache-Control", ""):
+            cached = inmate_response_cache.get(key)
+            if cached is not None and cached[0] > now:
+                _, body, etag = cached
+                return send_json_with_etag(body, etag)
+
+        generation = inmate_response_generation
+        result = route(*args, **kwargs)
+        body = orjson.dumps(result)
+        etag = get_etag(body)
+
+        with inmate_response_lock:
+            for key_, (expiry, _, _) in list(inmate_response_cache.items()):
+                if expiry <= now:
+                    del inmate_response_cache[key_]
+
+            # Skip caching if the inmate may have changed while building it.
+            if not result["errors"] and generation == inmate_response_generation:
+                inmate_response_cache[key] = now + INMATE_RESPONSE_TTL, body, etag
+
+        return send_json_with_etag(body, etag)
+
+    return wrapper
+
+
+def conditional_get(route):
+    """Decorate a route to send its JSON response with an ETag.
+
+    The response is still built on every call, but clients that already hold
+    an identical copy get a bodiless 304 instead.
+
+    """
+
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        body = orjson.dumps(route(*args, **kwargs))
+        return send_json_with_etag(body, get_etag(body))
+
+    return wrapper
+
+
+@app.hook("after_request")
+def invalidate_cached_responses():
+    """Invalidate cached responses when a route changes their data."""
+    global inmate_response_generation  # pylint: disable=global-statement
+
+    request = bottle.request
+    if request.method in ("GET", "HEAD", "OPTIONS"):
+        return
+
+    if request.path.startswith(("/request/", "/comment/")):
+        args = request.url_args
+        if "jurisdiction" in args and "inmate_id" in args:
+            key = args["jurisdiction"], args["inmate_id"]
+            with inmate_response_lock:
+                inmate_response_generation += 1
+                inmate_response_cache.pop(key, None)
+
+
+INMATE_ID_REGEX = re.compile(r"\s*[\d-]*\d[\d-]*\s*")
+"""Regular expression matching inmate IDs, which may contain dashes."""
+
+
+def parse_inmate_id(search):
+    """Parse an inmate ID from a search string or return None if not an ID."""
+    if INMATE_ID_REGEX.fullmatch(search) is None:
+        return None
+
+    return int(search.replace("-", ""))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_name(search):
+    """Parse the first and last names from a search string.
+
+    Parses are cached since the same names tend to be searched repeatedly.
+
+    :returns: tuple of (:py:data:`first_name`, :py:data:`last_name`).
+
+    """
+    name = nameparser.HumanName(search)
+    return name.first, name.last
+
+
+def parse_request_json(load, allow_many=False):
+    """Parse the bottle request JSON using a schema load method.
+
+    If ``allow_many`` is set, a JSON array is loaded as a list of objects.
+
+    """
+    data = read_request_json()
+    many = allow_many and isinstance(data, list)
+
+    try:
+        return load(data, many=many)
     except marshmallow.exceptions.ValidationError as exc:
         raise bottle.HTTPError(400, exc.messages, exc)
 
 
 def ship_request(session, request):
     """Ship a request."""
+    fields = parse_request_json(_shipment_load)
+
     inmate = request.inmate
-    if inmate.db_entry_is_stale():
-        db.query_providers_by_id(session, inmate.id)
+    refresh_inmate_if_stale(session, inmate)
 
     unit = inmate.unit
     if unit is None:
         raise bottle.HTTPError(400, "Inmate is not assigned to a unit.")
 
-    fields = parse_request_json(schemas.shipment)
-
     shipment = models.Shipment(
         requests=[request], date_shipped=date.today(), unit=unit, **fields
     )
     session.add(shipment)
     session.commit()
 
-    return schemas.shipment.dump(shipment)
+    return _shipment_dump(shipment)
 
 
-#################
-# Options route #
-#################
+##################
+# CORS preflight #
+##################
+
 
+PREFLIGHT_HEADERS = [*CORS_HEADERS.items(), ("Content-Length", "0")]
+"""WSGI headers sent in response to CORS preflight requests."""
 
-@app.route("/<:re:.*>", method="OPTIONS", skip=[create_sqlalchemy_session])
-def enable_options_generic_route():
-    """Respond to all OPTIONS method for all routes."""
+
+def answer_preflight_requests(wsgi_app):
+    """Wrap a WSGI application to answer OPTIONS requests directly.
+
+    CORS preflight requests are answered before :py:mod:`bottle` routes them,
+    so they never reach the router, the plugins, or the database.
+
+    """
+
+    def wrapper(environ, start_response):
+        if environ["REQUEST_METHOD"] == "OPTIONS":
+            start_response("204 No Content", PREFLIGHT_HEADERS)
+            return [b""]
+        return wsgi_app(environ, start_response)
+
+    # The wrapped app may be a Bottle instance, whose __dict__ must not be copied.
+    wrapper.__wrapped__ = wsgi_app
+    return wrapper
+
+
+application = answer_preflight_requests(app)  # pylint: disable=invalid-name
+"""WSGI entry point for serving the app."""
 
 
 #################
@@ -306,8 +811,14 @@ def enable_options_generic_route():
 #################
 
 
-@app.get("/inmate/<jurisdiction>/<inmate_id:int>")
-@load_inmate_from_url_params
+@app.get("/inmate/<jurisdiction:jurisdiction>/<inmate_id:int>")
+@cache_inmate_response
+@load_inmate_from_url_params(
+    joinedload(models.Inmate.unit),
+    selectinload(models.Inmate.lookups),
+    selectinload(models.Inmate.comments),
+    selectinload(models.Inmate.requests),
+)
 def show_inmate(session, inmate):
     """:py:mod:`bottle` route to handle a GET request for an inmate's info.
 
@@ -328,12 +839,8 @@ def show_inmate(session, inmate):
         - :py:data:`errors` List of error strings encountered during lookup.
 
     """
-    errors = []
-    if inmate.db_entry_is_stale():
-        inmates, errors = db.query_providers_by_id(session, inmate.id)
-        inmate = inmates.filter_by(jurisdiction=inmate.jurisdiction).one()
-
-    return {"errors": errors, "inmate": schemas.inmate.dump(inmate)}
+    errors = refresh_inmate_if_stale(session, inmate)
+    return {"errors": errors, "inmate": _inmate_dump(inmate)}
 
 
 @app.get("/inmate")
@@ -358,20 +865,23 @@ def search_inmates(session):
     if not search:
         raise bottle.HTTPError(400, "Some search input must be provided")
 
-    try:
-        inmate_id = int(search.replace("-", ""))
+    inmate_id = parse_inmate_id(search)
+
+    if inmate_id is not None:
         inmates, errors = db.query_providers_by_id(session, inmate_id)
 
-    except ValueError:
-        name = nameparser.HumanName(search)
+    else:
+        # Collapse whitespace so that variants of a search share a cache entry.
+        first_name, last_name = parse_name(" ".join(search.split()))
 
-        if not (name.first and name.last):
+        if not (first_name and last_name):
             message = "If using a name, please specify first and last name"
-            raise bottle.HTTPError(400, message)  # pylint: disable=raise-missing-from
+            raise bottle.HTTPError(400, message)
 
-        inmates, errors = db.query_providers_by_name(session, name.first, name.last)
+        inmates, errors = db.query_providers_by_name(session, first_name, last_name)
 
-    return {"inmates": schemas.inmates.dump(inmates), "errors": errors}
+    inmates = inmates.options(*INMATES_SUMMARY)
+    return {"inmates": _inmates_dump(inmates), "errors": errors}
 
 
 ##################
@@ -379,8 +889,8 @@ def search_inmates(session):
 ##################
 
 
-@app.post("/request/<jurisdiction>/<inmate_id:int>")
-@load_inmate_from_url_params
+@app.post("/request/<jurisdiction:jurisdiction>/<inmate_id:int>")
+@load_inmate_from_url_params()
 def create_request(session, inmate):
     """:py:mod:`bottle` route to handle creating a request.
 
@@ -395,22 +905,31 @@ def create_request(session, inmate):
 
     This is used to load the appropriate inmate for request creation.
 
+    The JSON data may also be an array of requests, in which case all of them
+    are validated in one pass and created within a single commit.
+
     :returns: :py:mod:`bottle` JSON response containing the request information.
+        For an array of requests, this is a JSON object whose
+        :py:data:`requests` field lists the information of each request.
 
     """
-    fields = parse_request_json(schemas.request)
+    fields = parse_request_json(_request_load, allow_many=True)
+    many = isinstance(fields, list)
 
-    index = misc.get_next_available_index(item.index for item in inmate.requests)
-    request = models.Request(index=index, date_processed=date.today(), **fields)
-    inmate.requests.append(request)
+    date_processed = date.today()
+    items = [
+        dict(date_processed=date_processed, **item)
+        for item in (fields if many else [fields])
+    ]
+    requests = db.insert_with_indices(session, models.Request, inmate, items)
 
-    session.add(request)
-    session.commit()
+    if many:
+        return {"requests": _request_dump(requests, many=True)}
 
-    return schemas.request.dump(request)
+    return _request_dump(requests[0])
 
 
-@app.delete("/request/<jurisdiction>/<inmate_id:int>/<index:int>")
+@app.delete("/request/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>")
 @load_cls_from_inmate_index(models.Request)
 def delete_request(session, request):
     """:py:mod:`bottle` route to handle deleting a request.
@@ -434,10 +953,11 @@ def delete_request(session, request):
     """
     session.delete(request)
     session.commit()
+    remove_label_cache_files(request)
     return {}
 
 
-@app.put("/request/<jurisdiction>/<inmate_id:int>/<index:int>")
+@app.put("/request/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>")
 @load_cls_from_inmate_index(models.Request)
 def update_request(session, request):
     """:py:mod:`bottle` route to handle updating a request.
@@ -459,17 +979,16 @@ def update_request(session, request):
     :returns: :py:mod:`bottle` JSON response containing the request information.
 
     """
-    fields = parse_request_json(schemas.request)
+    fields = parse_request_json(_request_load)
 
     request.update_from_kwargs(**fields)
-    session.add(request)
     session.commit()
 
-    return schemas.request.dump(request)
+    return _request_dump(request)
 
 
-@app.get("/request/<jurisdiction>/<inmate_id:int>/<index:int>/label")
-@load_cls_from_inmate_index(models.Request)
+@app.get("/request/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>/label")
+@load_cls_from_inmate_index(models.Request, REQUEST_INMATE_UNIT)
 def get_request_label(session, request):  # pylint: disable=unused-argument
     """:py:mod:`bottle` route to get a label for a request.
 
@@ -490,15 +1009,22 @@ def get_request_label(session, request):  # pylint: disable=unused-argument
     :returns: :py:mod:`bottle` image/png bytes object.
 
     """
-    label = misc.render_request_label(request)
-    label_bytes_io = io.BytesIO()
-    label.save(label_bytes_io, "PNG")
-    label_bytes = label_bytes_io.getvalue()
-    return send_bytes(label_bytes, "image/png")
+    directory = get_label_cache_dir(request)
+    filename = get_label_cache_filename(request)
+    filepath = directory.joinpath(filename)
 
+    if not filepath.exists():
+        label = misc.render_request_label(request)
+        write_label_cache_file(filepath, label)
+        # Drop the labels rendered before the request or its inmate changed.
+        remove_label_cache_files(request, keep=filename)
 
-@app.get("/request/<jurisdiction>/<inmate_id:int>/<index:int>/address")
-@load_cls_from_inmate_index(models.Request)
+    return bottle.static_file(filename, root=str(directory), mimetype="image/png")
+
+
+@app.get("/request/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>/address")
+@conditional_get
+@load_cls_from_inmate_index(models.Request, REQUEST_INMATE_UNIT)
 def get_request_address_inmate_index(session, request):
     """:py:mod:`bottle` route to get the address for a request.
 
@@ -522,8 +1048,8 @@ def get_request_address_inmate_index(session, request):
     return get_request_address(session, request)
 
 
-@app.post("/request/<jurisdiction>/<inmate_id:int>/<index:int>/ship")
-@load_cls_from_inmate_index(models.Request)
+@app.post("/request/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>/ship")
+@load_cls_from_inmate_index(models.Request, REQUEST_INMATE_UNIT)
 def ship_request_inmate_index(session, request):
     """:py:mod:`bottle` route to ship a request.
 
@@ -548,7 +1074,8 @@ def ship_request_inmate_index(session, request):
 
 
 @app.get("/request/<autoid:int>/address")
-@load_cls_from_autoid(models.Request)
+@conditional_get
+@load_cls_from_autoid(models.Request, REQUEST_INMATE_UNIT)
 def get_request_address_autoid(session, request):
     """:py:mod:`bottle` route to get an address for shipping a request given its autoid.
 
@@ -567,7 +1094,7 @@ def get_request_address_autoid(session, request):
 
 
 @app.post("/request/<autoid:int>/ship")
-@load_cls_from_autoid(models.Request)
+@load_cls_from_autoid(models.Request, REQUEST_INMATE_UNIT)
 def ship_request_autoid(session, request):
     """:py:mod:`bottle` route to ship a request given its autoid.
 
@@ -590,8 +1117,8 @@ def ship_request_autoid(session, request):
 ##################
 
 
-@app.post("/comment/<jurisdiction>/<inmate_id:int>")
-@load_inmate_from_url_params
+@app.post("/comment/<jurisdiction:jurisdiction>/<inmate_id:int>")
+@load_inmate_from_url_params()
 def create_comment(session, inmate):
     """:py:mod:`bottle` route to handle creating a comment.
 
@@ -609,19 +1136,15 @@ def create_comment(session, inmate):
     :returns: :py:mod:`bottle` JSON response containing the comment information.
 
     """
-    fields = parse_request_json(schemas.comment)
+    fields = parse_request_json(_comment_load)
 
-    index = misc.get_next_available_index(item.index for item in inmate.comments)
-    comment = models.Comment(index=index, datetime=datetime.now(), **fields)
+    item = dict(datetime=datetime.now(), **fields)
+    (comment,) = db.insert_with_indices(session, models.Comment, inmate, [item])
 
-    inmate.comments.append(comment)
-    session.add(comment)
-    session.commit()
+    return _comment_dump(comment)
 
-    return schemas.comment.dump(comment)
 
-
-@app.delete("/comment/<jurisdiction>/<inmate_id:int>/<index:int>")
+@app.delete("/comment/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>")
 @load_cls_from_inmate_index(models.Comment)
 def delete_comment(session, comment):
     """:py:mod:`bottle` route to handle deleting a comment.
@@ -648,7 +1171,7 @@ def delete_comment(session, comment):
     return {}
 
 
-@app.put("/comment/<jurisdiction>/<inmate_id:int>/<index:int>")
+@app.put("/comment/<jurisdiction:jurisdiction>/<inmate_id:int>/<index:int>")
 @load_cls_from_inmate_index(models.Comment)
 def update_comment(session, comment):
     """:py:mod:`bottle` route to handle updating a comment.
@@ -670,21 +1193,26 @@ def update_comment(session, comment):
     :returns: :py:mod:`bottle` JSON response containing the comment information.
 
     """
-    fields = parse_request_json(schemas.comment)
+    fields = parse_request_json(_comment_load)
 
     comment.update_from_kwargs(**fields)
-    session.add(comment)
     session.commit()
 
-    return schemas.comment.dump(comment)
+    return _comment_dump(comment)
 
 
 ###############
 # Unit routes #
 ###############
 
+UNIT_ADDRESS_NAME = config.get(
+    "shipping", "unit_address_name", fallback="ATTN: Mailroom Staff"
+)
+"""Name line used on bulk shipping addresses for units."""
+
 
 @app.get("/unit/<id:int>/address")
+@cache_response
 @load_unit_from_url_params
 def get_unit_address(session, unit):  # pylint: disable=unused-argument
     """:py:mod:`bottle` route to get the bulk shipping address for a unit.
@@ -698,13 +1226,8 @@ def get_unit_address(session, unit):  # pylint: disable=unused-argument
     :returns: :py:mod:`bottle` JSON response containing the unit bulk shipping address.
 
     """
-    try:
-        name = config["shipping"]["unit_address_name"]
-    except AttributeError:
-        name = "ATTN: Mailroom Staff"
-
     return {
-        "name": name,
+        "name": UNIT_ADDRESS_NAME,
         "street1": unit.street1,
         "street2": unit.street2,
         "city": unit.city,
@@ -727,7 +1250,7 @@ def ship_to_unit(session, unit):
     :returns: :py:mod:`bottle` JSON response containing the bulk shipment information.
 
     """
-    fields = parse_request_json(schemas.shipment)
+    fields = parse_request_json(_shipment_load)
 
     shipment = models.Shipment(
         requests=[], unit=unit, date_shipped=date.today(), **fields
@@ -735,26 +1258,36 @@ def ship_to_unit(session, unit):
     session.add(shipment)
     session.commit()
 
-    return schemas.shipment.dump(shipment)
+    return _shipment_dump(shipment)
 
 
 @app.get("/units")
+@cache_response
 def get_units(session):
     """:py:mod:`bottle` route for getting a list of units.
 
     :returns: :py:mod:`bottle` JSON response containing the list of units.
 
     """
-    units = session.query(models.Unit)
-    return {"units": schemas.units.dump(units)}
+    units = session.query(models.Unit).options(
+        load_only(models.Unit.id, models.Unit.name)
+    )
+    return {"units": _units_dump(units)}
 
 
 ################
 # Misc. routes #
 ################
 
+SERVER_CONFIG = {
+    "warnings": {key: int(value) for (key, value) in config["warnings"].items()},
+    "address": dict(config["address"]),
+}
+"""Server configuration exposed to clients."""
+
 
-@app.get("/config", skip=[create_sqlalchemy_session])
+@app.get("/config", session=False)
+@cache_response
 def get_config():
     """:py:mod:`bottle` route for getting the server configuration.
 
@@ -764,6 +1297,4 @@ def get_config():
         - :py:data:`address` JSON encoding of the return address.
 
     """
-    warnings = dict((key, int(value)) for (key, value) in config["warnings"].items())
-    address = dict(config["address"])
-    return {"warnings": warnings, "address": address}
+    return SERVER_CONFIG
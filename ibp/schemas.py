@@ -167,3 +167,24 @@ inmates = InmateSchema(
     many=True, only=["jurisdiction", "id", "first_name", "last_name", "unit.name"]
 )
 """Schema object for marshalling multiple :py:class:`ibp.models.Inmate` objects."""
+
+
+def dump_inmates(inmates):
+    """Dump multiple :py:class:`ibp.models.Inmate` objects like :py:data:`inmates`.
+
+    Inmate search results have a small, fixed set of fields, so they are dumped
+    directly instead of going through the per-field :py:mod:`marshmallow`
+    machinery. The output is identical to ``inmates.dump(inmates)``, which the
+    test suite checks.
+
+    """
+    return [
+        {
+            "jurisdiction": inmate.jurisdiction,
+            "id": inmate.id,
+            "first_name": inmate.first_name,
+            "last_name": inmate.last_name,
+            "unit": None if inmate.unit is None else {"name": inmate.unit.name},
+        }
+        for inmate in inmates
+    ]
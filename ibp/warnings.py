@@ -4,6 +4,12 @@
 from datetime import date, datetime, timedelta
 
 from .base import config
+from .models import INMATES_CACHE_TTL
+
+MIN_RELEASE_TIMEDELTA = timedelta(
+    days=config.getint("warnings", "min_release_timedelta")
+)
+"""Time to release within which an inmate warrants a warning."""
 
 
 def inmate_entry_age(inmate):
@@ -16,9 +22,7 @@ def inmate_entry_age(inmate):
             f" has never been verified."
         )
     else:
-        inmates_cache_ttl = config.getint("warnings", "inmates_cache_ttl")
-        ttl = timedelta(hours=inmates_cache_ttl)
-        if age > ttl:
+        if age > INMATES_CACHE_TTL:
             return (
                 f"Data entry for {inmate.jurisdiction} inmate #{inmate.id:08d}"
                 f" is {age.days} day(s) old."
@@ -34,13 +38,10 @@ def inmate_pending_release(inmate):
     except TypeError:
         return None
 
-    min_release_days = config.getint("warnings", "min_release_timedelta")
-    min_timedelta = timedelta(days=min_release_days)
-
     if to_release <= timedelta(0):
         return f"{inmate.jurisdiction} inmate #{inmate.id:08d} is marked as released"
 
-    if to_release <= min_timedelta:
+    if to_release <= MIN_RELEASE_TIMEDELTA:
         return (
             f"{inmate.jurisdiction} inmate #{inmate.id:08d} is"
             f" {to_release.days} day(s) from release."
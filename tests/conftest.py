@@ -0,0 +1,152 @@
+"""Shared fixtures for the IBP server tests."""
+
+import io
+import json
+import typing
+from datetime import datetime
+from wsgiref.headers import Headers
+from wsgiref.util import setup_testing_defaults
+
+import pytest
+import sqlalchemy  # type: ignore
+
+import ibp
+from ibp import db, models, routes
+
+
+class Response(typing.NamedTuple):
+    """Response of the WSGI application to a test request."""
+
+    status: int
+    headers: Headers
+    body: bytes
+
+    @property
+    def json(self):
+        """Decode the JSON body of the response."""
+        return json.loads(self.body)
+
+
+class Client:
+    """Minimal WSGI client for :py:data:`ibp.application`."""
+
+    def request(self, method, path, body=None, headers=None):
+        """Send a request with an optional JSON body and get the response."""
+        environ = {}
+        setup_testing_defaults(environ)
+        environ["REQUEST_METHOD"] = method
+        environ["PATH_INFO"] = path
+
+        if body is not None:
+            data = json.dumps(body).encode()
+            environ["wsgi.input"] = io.BytesIO(data)
+            environ["CONTENT_LENGTH"] = str(len(data))
+            environ["CONTENT_TYPE"] = "application/json"
+
+        for name, value in (headers or {}).items():
+            environ["HTTP_" + name.upper().replace("-", "_")] = value
+
+        started = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            # pylint: disable=unused-argument
+            started["status"] = int(status.split()[0])
+            started["headers"] = Headers(response_headers)
+
+        data = b"".join(ibp.application(environ, start_response))
+        return Response(started["status"], started["headers"], data)
+
+    def get(self, path, **kwargs):
+        """Send a GET request."""
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, body=None, **kwargs):
+        """Send a POST request."""
+        return self.request("POST", path, body=body, **kwargs)
+
+    def delete(self, path, **kwargs):
+        """Send a DELETE request."""
+        return self.request("DELETE", path, **kwargs)
+
+
+class Providers:
+    """Stand-in for the :py:mod:`pymates` inmate providers."""
+
+    def __init__(self):
+        self.calls = []
+        self.responses = []
+        self.errors = []
+
+    def query_by_inmate_id(self, inmate_id, *args, **kwargs):
+        """Record an inmate ID query and return the configured results."""
+        # pylint: disable=unused-argument
+        self.calls.append(inmate_id)
+        return list(self.responses), list(self.errors)
+
+    def query_by_name(self, first_name, last_name, *args, **kwargs):
+        """Record an inmate name query and return the configured results."""
+        # pylint: disable=unused-argument
+        self.calls.append((first_name, last_name))
+        return list(self.responses), list(self.errors)
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path):
+    """Bind the session registry to a fresh database for each test."""
+    engine = sqlalchemy.create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        connect_args={"check_same_thread": False},
+    )
+    models.Base.metadata.create_all(engine)
+
+    db.Session.remove()
+    db.Session.configure(bind=engine)
+    yield engine
+    db.Session.remove()
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def caches(tmp_path, monkeypatch):
+    """Start each test with empty in-memory caches and label cache directory."""
+    monkeypatch.setattr(routes, "response_cache", {})
+    monkeypatch.setattr(routes, "inmate_response_cache", {})
+    monkeypatch.setattr(routes, "provider_refreshes", {})
+    monkeypatch.setattr(routes, "provider_refreshes_in_flight", {})
+    monkeypatch.setattr(routes, "LABEL_CACHE_DIR", tmp_path / "labels")
+
+
+@pytest.fixture(autouse=True)
+def providers(monkeypatch):
+    """Replace the inmate providers so that tests never touch the network."""
+    stand_in = Providers()
+    monkeypatch.setattr(db.pymates, "query_by_inmate_id", stand_in.query_by_inmate_id)
+    monkeypatch.setattr(db.pymates, "query_by_name", stand_in.query_by_name)
+    return stand_in
+
+
+@pytest.fixture
+def client():
+    """Client for the WSGI application."""
+    return Client()
+
+
+@pytest.fixture
+def inmate():
+    """Add a freshly fetched inmate assigned to a unit to the database."""
+    session = db.Session()
+    unit = models.Unit(
+        name="Alpha", street1="1 A St", city="Austin", state="TX", zipcode="78701"
+    )
+    inmate_ = models.Inmate(
+        jurisdiction="Texas",
+        id=12345678,
+        first_name="JOHN",
+        last_name="SMITH",
+        datetime_fetched=datetime.now(),
+        unit=unit,
+    )
+    session.add(inmate_)
+    session.commit()
+    db.Session.remove()
+    return inmate_
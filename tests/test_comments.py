@@ -0,0 +1,17 @@
+"""Tests for the comment routes of :py:mod:`ibp.routes`."""
+
+import pytest
+
+
+@pytest.mark.usefixtures("inmate")
+def test_create_comment_reuses_index_gaps(client):
+    """Indices freed by deleted comments are reused before new ones."""
+    url = "/comment/Texas/12345678"
+    comment = {"author": "volunteer", "body": "Sent a dictionary."}
+    for _ in range(2):
+        client.post(url, comment)
+
+    assert client.delete(f"{url}/0").status == 200
+
+    assert client.post(url, comment).json["index"] == 0
+    assert client.post(url, comment).json["index"] == 2
@@ -0,0 +1,83 @@
+"""Tests for the inmate routes and response caches of :py:mod:`ibp.routes`."""
+
+import pytest
+
+from ibp import db, models
+
+URL = "/inmate/Texas/12345678"
+
+
+def rename_inmate(first_name):
+    """Rename the test inmate directly in the database."""
+    session = db.Session()
+    session.get(models.Inmate, ("Texas", 12345678)).first_name = first_name
+    session.commit()
+    db.Session.remove()
+
+
+@pytest.mark.usefixtures("inmate")
+def test_show_inmate_is_cached(client):
+    """Repeated inmate lookups are served from memory unless bypassed."""
+    assert client.get(URL).json["inmate"]["first_name"] == "JOHN"
+
+    rename_inmate("JOHNNY")
+
+    assert client.get(URL).json["inmate"]["first_name"] == "JOHN"
+    response = client.get(URL, headers={"Cache-Control": "no-cache"})
+    assert response.json["inmate"]["first_name"] == "JOHNNY"
+
+
+@pytest.mark.usefixtures("inmate")
+@pytest.mark.parametrize("path", [URL, "/inmate/Texas/012345678"])
+def test_show_inmate_cache_invalidated_by_comment(client, path):
+    """Creating a comment invalidates the cached inmate response."""
+    assert client.get(path).json["inmate"]["comments"] == []
+
+    comment = {"author": "volunteer", "body": "Sent a dictionary."}
+    assert client.post("/comment/Texas/12345678", comment).status == 200
+
+    comments = client.get(path).json["inmate"]["comments"]
+    assert [item["body"] for item in comments] == ["Sent a dictionary."]
+
+
+@pytest.mark.usefixtures("inmate")
+def test_show_inmate_errors_are_not_cached(client, providers, database):
+    """Responses with provider errors are not cached."""
+    with database.begin() as connection:
+        connection.execute(
+            models.Inmate.__table__.update().values(datetime_fetched=None)
+        )
+
+    providers.errors = ["Texas provider is down."]
+    assert client.get(URL).json["errors"] == ["Texas provider is down."]
+    assert client.get(URL).json["errors"] == ["Texas provider is down."]
+    assert providers.calls == [12345678]
+
+
+@pytest.mark.usefixtures("inmate")
+@pytest.mark.parametrize(
+    "path",
+    [
+        URL,
+        "/config",
+        "/units",
+        "/unit/1/address",
+        "/request/Texas/12345678/0/address",
+    ],
+)
+def test_not_modified(client, path):
+    """Clients holding the current ETag get a bodiless 304."""
+    client.post(
+        "/request/Texas/12345678", {"date_postmarked": "2026-01-01", "action": "Filled"}
+    )
+
+    response = client.get(path)
+    assert response.status == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert response.body == b""
+
+    response = client.get(path, headers={"If-None-Match": '"stale"'})
+    assert response.status == 200
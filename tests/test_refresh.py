@@ -0,0 +1,101 @@
+"""Tests for the provider refreshes of stale inmates in :py:mod:`ibp.routes`."""
+
+import time
+import threading
+
+import pytest
+
+from ibp import db, models, routes
+
+URL = "/inmate/Texas/12345678"
+
+
+@pytest.fixture
+def stale_inmate(inmate, database):
+    """Mark the test inmate as never having been fetched from the providers."""
+    with database.begin() as connection:
+        connection.execute(
+            models.Inmate.__table__.update().values(datetime_fetched=None)
+        )
+    return inmate
+
+
+@pytest.fixture
+def blocked_providers(providers, monkeypatch):
+    """Make the provider stand-in block until its release event is set."""
+    release = threading.Event()
+    query_by_inmate_id = providers.query_by_inmate_id
+
+    def blocking_query_by_inmate_id(*args, **kwargs):
+        release.wait(5)
+        return query_by_inmate_id(*args, **kwargs)
+
+    monkeypatch.setattr(db.pymates, "query_by_inmate_id", blocking_query_by_inmate_id)
+    return release
+
+
+def wait_for_refresh_in_flight():
+    """Wait until a provider refresh has started."""
+    deadline = time.monotonic() + 5
+    while not routes.provider_refreshes_in_flight:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def get_in_threads(client, count):
+    """Start threads that each GET the test inmate and collect the responses."""
+    responses = []
+
+    def get():
+        responses.append(client.get(URL, headers={"Cache-Control": "no-cache"}))
+
+    threads = [threading.Thread(target=get) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, responses
+
+
+@pytest.mark.usefixtures("stale_inmate")
+def test_concurrent_refreshes_are_coalesced(client, providers, blocked_providers):
+    """Only one thread queries the providers and all report its errors."""
+    providers.errors = ["Texas provider is down."]
+
+    threads, responses = get_in_threads(client, 5)
+    wait_for_refresh_in_flight()
+    time.sleep(0.1)  # let the other threads start waiting on the refresh
+    blocked_providers.set()
+    for thread in threads:
+        thread.join()
+
+    assert providers.calls == [12345678]
+    assert [response.status for response in responses] == [200] * 5
+    assert all(
+        response.json["errors"] == ["Texas provider is down."] for response in responses
+    )
+
+
+@pytest.mark.usefixtures("stale_inmate")
+def test_waiting_refresh_times_out(client, blocked_providers, monkeypatch):
+    """A thread that waits too long on another refresh reports a timeout."""
+    monkeypatch.setattr(routes, "PROVIDERS_TIMEOUT", 0.05)
+
+    leader, _ = get_in_threads(client, 1)
+    wait_for_refresh_in_flight()
+
+    response = client.get(URL, headers={"Cache-Control": "no-cache"})
+    blocked_providers.set()
+    leader[0].join()
+
+    assert response.json["errors"] == ["Timed out waiting for the inmate providers."]
+
+
+@pytest.mark.usefixtures("stale_inmate")
+def test_throttled_refresh_reports_last_errors(client, providers):
+    """Within the retry interval, the last refresh errors are reported again."""
+    providers.errors = ["Texas provider is down."]
+
+    for _ in range(2):
+        response = client.get(URL, headers={"Cache-Control": "no-cache"})
+        assert response.json["errors"] == ["Texas provider is down."]
+
+    assert providers.calls == [12345678]
@@ -0,0 +1,104 @@
+"""Tests for the request routes of :py:mod:`ibp.routes`."""
+
+import pytest
+
+from ibp import db, models, routes
+
+URL = "/request/Texas/12345678"
+
+
+@pytest.mark.usefixtures("inmate")
+def test_create_request(client):
+    """A single request is created at the first index."""
+    response = client.post(URL, {"date_postmarked": "2026-01-01", "action": "Filled"})
+
+    assert response.status == 200
+    assert response.json == {
+        "index": 0,
+        "date_postmarked": "2026-01-01",
+        "action": "Filled",
+    }
+
+
+@pytest.mark.usefixtures("inmate")
+def test_create_request_batch(client):
+    """An array of requests is created at consecutive indices."""
+    response = client.post(
+        URL,
+        [
+            {"date_postmarked": "2026-01-01", "action": "Filled"},
+            {"date_postmarked": "2026-01-02", "action": "Tossed"},
+        ],
+    )
+
+    assert response.status == 200
+    assert [item["index"] for item in response.json["requests"]] == [0, 1]
+    assert [item["action"] for item in response.json["requests"]] == [
+        "Filled",
+        "Tossed",
+    ]
+
+
+@pytest.mark.usefixtures("inmate")
+def test_create_request_empty_batch(client):
+    """An empty array of requests creates nothing."""
+    response = client.post(URL, [])
+
+    assert response.status == 200
+    assert response.json == {"requests": []}
+    assert client.get("/inmate/Texas/12345678").json["inmate"]["requests"] == []
+
+
+@pytest.mark.usefixtures("inmate")
+def test_create_request_batch_partially_invalid(client):
+    """A batch with an invalid request is rejected as a whole."""
+    response = client.post(
+        URL,
+        [
+            {"date_postmarked": "2026-01-01", "action": "Filled"},
+            {"action": "Filled"},
+        ],
+    )
+
+    assert response.status == 400
+    assert "date_postmarked" in response.json["messages"][0]
+    assert '"1"' in response.json["messages"][0]
+    assert client.get("/inmate/Texas/12345678").json["inmate"]["requests"] == []
+
+
+@pytest.mark.usefixtures("inmate")
+def test_create_request_reuses_index_gaps(client):
+    """Indices freed by deleted requests are reused before new ones."""
+    request = {"date_postmarked": "2026-01-01", "action": "Filled"}
+    for _ in range(3):
+        client.post(URL, request)
+
+    assert client.delete(f"{URL}/1").status == 200
+
+    response = client.post(URL, [request, request])
+    assert [item["index"] for item in response.json["requests"]] == [1, 3]
+
+
+@pytest.mark.usefixtures("inmate")
+def test_label_cache_is_pruned(client):
+    """Outdated and deleted labels are removed from the label cache."""
+    client.post(URL, {"date_postmarked": "2026-01-01", "action": "Filled"})
+    directory = routes.LABEL_CACHE_DIR.joinpath("Texas", "12345678")
+
+    response = client.get(f"{URL}/0/label")
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "image/png"
+    (original,) = directory.iterdir()
+
+    session = db.Session()
+    session.get(models.Inmate, ("Texas", 12345678)).first_name = "JOHNNY"
+    session.commit()
+    db.Session.remove()
+
+    head = client.request("HEAD", f"{URL}/0/label")
+    (renamed,) = directory.iterdir()
+    assert renamed != original
+    assert head.headers["Content-Length"] == str(renamed.stat().st_size)
+
+    assert client.delete(f"{URL}/0").status == 200
+    assert not list(directory.iterdir())
@@ -0,0 +1,25 @@
+"""Tests for :py:mod:`ibp.schemas`."""
+
+import pytest
+
+from ibp import models, schemas
+
+
+def make_unit():
+    """Make a transient unit."""
+    return models.Unit(
+        name="Alpha", street1="1 A St", city="Austin", state="TX", zipcode="78701"
+    )
+
+
+@pytest.mark.parametrize("unit", [make_unit(), None])
+def test_dump_inmates_matches_schema(unit):
+    """The hand-written inmate search dump matches the schema dump."""
+    inmates = [
+        models.Inmate(
+            jurisdiction="Texas", id=1, first_name="JOHN", last_name="SMITH", unit=unit
+        ),
+        models.Inmate(jurisdiction="Federal", id=2, first_name="JANE", last_name=None),
+    ]
+
+    assert schemas.dump_inmates(inmates) == schemas.inmates.dump(inmates)